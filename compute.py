@@ -10,7 +10,15 @@ Functions:
     default_fractal_function: Default z² + c fractal function
     create_fractal_function: Creates fractal function from string
     compute_pixel_batch: Computes fractal values for a batch of pixels
+    compute_pixels: Generates the fractal as an RGB array
     compute: Main function to generate fractal images
+    compute_batch: Generates the images of several views at once
+    view_precision: Chooses the kernel precision of a view
+    clear_cache: Frees the reused arrays and created functions
+
+The default z² + c function is computed by a Numba JIT kernel when numba
+is installed and by vectorized NumPy otherwise, custom functions use the
+multiprocessing fallback.
 
 Example:
     >>> from compute import compute
@@ -19,31 +27,126 @@ Example:
 """
 
 from typing import Callable, Optional
-from multiprocessing import Pool, cpu_count
+from collections import OrderedDict
+from functools import lru_cache
+from multiprocessing import cpu_count, get_context
+from multiprocessing.pool import ThreadPool
+import ast
+import atexit
+import cmath
 import math
+import threading
 import numpy as np
 from PIL import Image
 
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    # same name as numba's, so the kernels run unchanged as plain Python
+    prange = range  # pylint: disable=invalid-name
+
+    def njit(*_args, **_kwargs):
+        """Fallback decorator used when numba is not installed"""
+        def decorator(func):
+            return func
+        return decorator
+
+try:
+    from numba import cuda
+    CUDA_AVAILABLE = cuda.is_available()
+except ImportError:
+    CUDA_AVAILABLE = False
+
+# fork is not safe once the parallel numba runtime is loaded, so the pool
+# workers are always started fresh
+_MP_CONTEXT = get_context('spawn')
+
+# worker pool shared by all compute() calls, created on first use
+_POOL = None
+
+# threads for the NumPy tiles, NumPy releases the GIL in its loops
+_THREAD_POOL = None
+
+# reused scratch arrays of each thread, see _scratch
+_SCRATCH = threading.local()
+_SCRATCH_MAX_ARRAYS = 8
+
+# a point escapes once |z| exceeds this radius
+ORBIT_RADIUS = 2.0
+_ORBIT_RADIUS_SQUARED = ORBIT_RADIUS * ORBIT_RADIUS
+
+# the escape-time iteration counts are int32 arrays throughout, uint16 ones
+# would overflow for iteration limits above 65535
+
+# row tiling of the pool work, with about 8 bytes of working data per pixel
+# 64 rows of 512 pixels fit a 256 KB L2 cache
+_L2_CACHE_BYTES = 256 * 1024
+_BYTES_PER_PIXEL = 8
+_MIN_TILE_ROWS = 8
+
+# smaller jobs are computed in this process, starting and feeding the pool
+# takes longer than they do
+_INLINE_MAX_PIXELS = 64 * 64
+
+# square tiles the threads of the NumPy path work on
+_NUMPY_TILE = 128
+
+# views with at least this many pixels are computed on the GPU if there is one
+_CUDA_MIN_PIXELS = 512 * 512
+_CUDA_BLOCK = (16, 16)
+
+# floating point precision of the z**2 kernels
+FP_DTYPES = {'fp32': np.float32, 'fp64': np.float64}
+
+# where the z**2 kernels run, auto uses the GPU for large enough views
+DEVICES = ('auto', 'cpu', 'cuda')
+
+# float32 stops resolving neighbouring pixels once they are closer than this
+DEEP_ZOOM_PIXEL_SPAN = 1e-5
+
+# fractal functions which are computed by the JIT kernel instead of eval
+MANDELBROT_FUNCTIONS = frozenset({'z**2', 'z*z'})
+
+# the only globals a fractal function sees, the names main.py lets through
+_FUNCTION_GLOBALS = {'__builtins__': {}, 'abs': abs, 'cmath': cmath, 'math': math}
+
+def _is_mandelbrot(func_str: Optional[str]) -> bool:
+    """Checks if func_str is z**2, ignoring whitespace, so the kernels can be used"""
+    return func_str is None or ''.join(func_str.split()) in MANDELBROT_FUNCTIONS
+
 def default_fractal_function(z: complex, c: complex) -> complex:
     """Default z² + c fractal function"""
     return z**2 + c
 
+# every batch of a view uses the same function, so it is only eval'd once
+@lru_cache(maxsize=32)
 def create_fractal_function(func_str: str) -> Callable[[complex, complex], complex]:
     """Creates fractal function from string"""
+    if _is_mandelbrot(func_str):
+        return default_fractal_function
+
     try:
-        func = eval(f'lambda z, c: {func_str} + c')
-        return func
+        code = compile(f'lambda z, c: {func_str} + c', '<fractal>', 'eval')
+        return eval(code, dict(_FUNCTION_GLOBALS))
     except:
         return default_fractal_function
 
-def compute_pixel_batch(args: tuple) -> list:
+def compute_pixel_batch(args: tuple) -> tuple[int, np.ndarray]:
     """Computes fractal values for a batch of pixels"""
-    start_row, end_row, x_values, y_values, func_str, max_iterations, gradient = args
+    start_row, end_row, x_values, y_values, func_str, max_iterations = args
 
     func = create_fractal_function(func_str)
 
-    results = []
-    orbit_radius = 2
+    # iteration counts of the rows in this batch, colored by the caller
+    strip = np.empty((end_row - start_row, len(x_values)), dtype=np.int32)
+
+    if func is default_fractal_function:
+        _mandel_numpy(np.asarray(x_values, dtype=np.float64),
+                      np.asarray(y_values[start_row:end_row], dtype=np.float64),
+                      max_iterations, strip)
+        return start_row, strip
 
     for row_idx in range(start_row, end_row):
         y = y_values[row_idx]
@@ -52,8 +155,9 @@ def compute_pixel_batch(args: tuple) -> list:
             c = complex(x, y)
 
             for iterator in range(max_iterations):
-                if abs(z) > orbit_radius:
-                    pixel_value = gradient[iterator]
+                # squared magnitude, abs() would take a square root
+                if z.real*z.real + z.imag*z.imag > _ORBIT_RADIUS_SQUARED:
+                    count = iterator
                     break
 
                 try:
@@ -61,23 +165,585 @@ def compute_pixel_batch(args: tuple) -> list:
                 except (ValueError, ZeroDivisionError):
                     z = c
             else:
-                pixel_value = gradient[0]
+                count = 0
 
-            results.append((row_idx, col_idx, pixel_value))
+            strip[row_idx - start_row, col_idx] = count
 
-    return results
+    return start_row, strip
 
-def compute(
+@njit(['boolean(float32, float32)', 'boolean(float64, float64)'],
+      fastmath=True, cache=True)
+def _in_cardioid_or_bulb(cr, ci):
+    """Closed-form test for the main cardioid and period-2 bulb of z² + c
+
+    Their points never escape, so every z**2 path skips them instead of
+    running max_iter iterations on each.
+    """
+    q = (cr - 0.25)**2 + ci*ci
+    in_cardioid = q*(q + (cr - 0.25)) <= 0.25*ci*ci
+    in_bulb = (cr + 1.0)**2 + ci*ci <= 0.0625
+    return in_cardioid or in_bulb
+
+@njit(['int64(float32, float32, int64)', 'int64(float64, float64, int64)'],
+      fastmath=True, cache=True)
+def _escape_count(cr, ci, max_iter):
+    """Escape-time iteration count of z² + c at one point, 0 if it never escapes"""
+    # constants of the coordinate type, so float32 views stay in float32
+    real = type(cr)
+    radius_squared = real(_ORBIT_RADIUS_SQUARED)
+    two = real(2.0)
+
+    if _in_cardioid_or_bulb(cr, ci):
+        return 0
+
+    zr, zi = real(0.0), real(0.0)
+
+    for iterator in range(max_iter):
+        if zr*zr + zi*zi > radius_squared:
+            return iterator
+
+        zr, zi = zr*zr - zi*zi + cr, two*zr*zi + ci
+
+    return 0
+
+# the signatures make numba compile (or load from the cache) at import time,
+# so the first update_fractal does not pay for the warm-up
+@njit(['void(float32, float32, float32, float32, int64, uint8[:, :], uint8[:, :, :])',
+       'void(float64, float64, float64, float64, int64, uint8[:, :], uint8[:, :, :])'],
+      parallel=True, fastmath=True, nogil=True, cache=True)
+def _mandel_rgb(x_ul, dx, y_ul, dy, max_iter, gradient, out):
+    """Escape-time gradient colors of z² + c, never escaped points get the first one"""
+    real = type(x_ul)
+
+    for row_idx in prange(out.shape[0]):
+        # indices in the type of the steps, see _domain_steps
+        ci = y_ul + real(row_idx)*dy
+        for col_idx in range(out.shape[1]):
+            count = _escape_count(x_ul + real(col_idx)*dx, ci, max_iter)
+            for channel in range(3):
+                out[row_idx, col_idx, channel] = gradient[count, channel]
+
+# escape-time kernel of the polynomial fractal functions, compiled once per function
+_POLYNOMIAL_KERNEL_SOURCE = """
+def _polynomial_kernel(x_values, y_values, max_iter, out):
+    for row_idx in prange(out.shape[0]):
+        for col_idx in range(out.shape[1]):
+            c = complex(x_values[col_idx], y_values[row_idx])
+            z = 0j
+            count = 0
+
+            for iterator in range(max_iter):
+                if z.real*z.real + z.imag*z.imag > radius_squared:
+                    count = iterator
+                    break
+
+                z = {expression} + c
+
+            out[row_idx, col_idx] = count
+"""
+
+_POLYNOMIAL_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Name, ast.Load, ast.Constant,
+                     ast.Add, ast.Sub, ast.Mult, ast.Pow, ast.UAdd, ast.USub)
+
+def _polynomial_tree(func_str: str) -> Optional[ast.Expression]:
+    """Parses func_str if it is a polynomial in z and c, with whole powers only"""
+    try:
+        tree = ast.parse(func_str, mode='eval')
+    except SyntaxError:
+        return None
+
+    for node in ast.walk(tree):
+        if not isinstance(node, _POLYNOMIAL_NODES):
+            return None
+        if isinstance(node, ast.Name) and node.id not in ('z', 'c'):
+            return None
+        if isinstance(node, ast.Constant) and (
+                isinstance(node.value, bool)
+                or not isinstance(node.value, (int, float, complex))):
+            return None
+        # whole powers of z or c only, fractional ones are not polynomials
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow) and not (
+                isinstance(node.right, ast.Constant) and isinstance(node.right.value, int)
+                and not isinstance(node.right.value, bool) and node.right.value >= 0
+                and any(isinstance(child, ast.Name) for child in ast.walk(node.left))):
+            return None
+
+    # other integers become floats, numba's int64 would overflow where Python's int doesn't
+    exponents = {id(node.right) for node in ast.walk(tree) if isinstance(node, ast.BinOp)
+                 and isinstance(node.op, ast.Pow)}
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Constant) and isinstance(node.value, int)
+                and not isinstance(node.value, bool) and id(node) not in exponents):
+            node.value = float(node.value)
+
+    return tree
+
+@lru_cache(maxsize=32)
+def _compile_polynomial(func_str: str) -> Optional[Callable]:
+    """Compiles the escape-time kernel of a polynomial func_str, None for anything else"""
+    if not NUMBA_AVAILABLE:
+        return None
+
+    tree = _polynomial_tree(func_str)
+    if tree is None:
+        return None
+
+    # the tree only holds arithmetic on z, c and numbers, so the source is safe to exec
+    namespace = {'prange': prange, 'radius_squared': _ORBIT_RADIUS_SQUARED}
+    source = _POLYNOMIAL_KERNEL_SOURCE.format(expression=ast.unparse(tree))
+    exec(source, namespace)  # pylint: disable=exec-used
+
+    try:
+        return njit('void(float64[:], float64[:], int64, int32[:, :])',
+                    parallel=True, nogil=True)(namespace['_polynomial_kernel'])
+    except Exception:  # pylint: disable=broad-exception-caught
+        # numba raises its own error types, e.g. for an integer constant it
+        # can't type, the pool still computes the function then
+        return None
+
+def _domain_steps(x_dom: np.ndarray, y_dom: np.ndarray) -> tuple[float, float, float, float]:
+    """First point and spacing (x0, dx, y0, dy) of evenly spaced domains
+
+    The kernels compute pixel (i, j) as (x0 + j*dx, y0 + i*dy) and convert
+    the indices to the type of the steps first, since an integer index times
+    a float32 step would be promoted to float64.
+    """
+    dx = (x_dom[-1] - x_dom[0]) / (len(x_dom) - 1) if len(x_dom) > 1 else 0.0
+    dy = (y_dom[-1] - y_dom[0]) / (len(y_dom) - 1) if len(y_dom) > 1 else 0.0
+    x0 = x_dom[0] if len(x_dom) else 0.0
+    y0 = y_dom[0] if len(y_dom) else 0.0
+
+    return x0, dx, y0, dy
+
+if CUDA_AVAILABLE:
+    @cuda.jit
+    def _mandel_cuda(view, max_iter, out):
+        """One thread per pixel escape-time counts of z² + c, view is (x0, y0, dx, dy)"""
+        real = view.dtype.type
+        col_idx, row_idx = cuda.grid(2)
+
+        if row_idx < out.shape[0] and col_idx < out.shape[1]:
+            # indices in the type of the steps, see _domain_steps
+            cr = view[0] + real(col_idx)*view[2]
+            ci = view[1] + real(row_idx)*view[3]
+            count = 0
+
+            # _in_cardioid_or_bulb, inlined for the device
+            q = (cr - real(0.25))*(cr - real(0.25)) + ci*ci
+            in_cardioid = q*(q + (cr - real(0.25))) <= real(0.25)*ci*ci
+            in_bulb = (cr + real(1.0))*(cr + real(1.0)) + ci*ci <= real(0.0625)
+
+            if not (in_cardioid or in_bulb):
+                zr, zi = real(0.0), real(0.0)
+
+                for iterator in range(max_iter):
+                    if zr*zr + zi*zi > real(_ORBIT_RADIUS_SQUARED):
+                        count = iterator
+                        break
+
+                    zr, zi = zr*zr - zi*zi + cr, real(2.0)*zr*zi + ci
+
+            out[row_idx, col_idx] = count
+
+    @cuda.jit
+    def _colorize_cuda(iters, gradient, rgb):
+        """Looks up the gradient color of every iteration count on the device"""
+        col_idx, row_idx = cuda.grid(2)
+
+        if row_idx < iters.shape[0] and col_idx < iters.shape[1]:
+            for channel in range(3):
+                rgb[row_idx, col_idx, channel] = gradient[iters[row_idx, col_idx], channel]
+
+def _compute_cuda(
+    max_iterations: int,
+    domains: list[tuple[np.ndarray, np.ndarray]],
+    gradient: np.ndarray,
+    dtype: type
+) -> list[np.ndarray]:
+
+    """Computes the z² + c RGB pixels of every region on the GPU"""
+
+    d_gradient = cuda.to_device(gradient)
+    d_frames = []
+
+    for x_dom, y_dom in domains:
+        height, width = len(y_dom), len(x_dom)
+
+        # the domains are evenly spaced, so the kernel only needs the steps
+        x0, dx, y0, dy = _domain_steps(x_dom, y_dom)
+        view = np.array([x0, y0, dx, dy], dtype=dtype)
+
+        grid = (math.ceil(width / _CUDA_BLOCK[0]), math.ceil(height / _CUDA_BLOCK[1]))
+        # the counts are colored before the next region's kernel runs on the same stream
+        d_iters = _scratch((height, width), np.int32, cuda.device_array)
+        d_rgb = cuda.device_array((height, width, 3), dtype=np.uint8)
+
+        _mandel_cuda[grid, _CUDA_BLOCK](cuda.to_device(view), max_iterations, d_iters)
+        _colorize_cuda[grid, _CUDA_BLOCK](d_iters, d_gradient, d_rgb)
+        d_frames.append(d_rgb)
+
+    # the frames stay on the device until all of them are done
+    return [d_rgb.copy_to_host() for d_rgb in d_frames]
+
+def _mandel_numpy(x_dom: np.ndarray, y_dom: np.ndarray, max_iter: int,
+                  out: np.ndarray) -> None:
+    """Vectorized escape-time iteration counts of z² + c, used without numba"""
+    # complex64 for float32 domains, complex128 for float64
+    complex_type = np.result_type(x_dom.dtype, np.complex64).type
+    c = (x_dom[None, :] + complex_type(1j) * y_dom[:, None]).ravel()
+    counts = np.zeros(c.shape, dtype=np.int32)
+
+    # _in_cardioid_or_bulb on the whole grid
+    cr, ci = c.real, c.imag
+    q = (cr - 0.25)**2 + ci*ci
+    interior = (q*(q + (cr - 0.25)) <= 0.25*ci*ci) | ((cr + 1.0)**2 + ci*ci <= 0.0625)
+
+    # only the points still alive are iterated, escaped ones are dropped from
+    # alive, z and c, so every step and alive check shrinks with the set
+    alive = np.flatnonzero(~interior)
+    c = c[alive]
+    z = np.zeros_like(c)
+
+    for iterator in range(max_iter):
+        escaped = z.real*z.real + z.imag*z.imag > _ORBIT_RADIUS_SQUARED
+        if escaped.any():
+            counts[alive[escaped]] = iterator
+
+            bounded = ~escaped
+            alive, z, c = alive[bounded], z[bounded], c[bounded]
+            if not alive.size:
+                break
+
+        z = z**2 + c
+
+    # points which never escaped keep the first color
+    out[:] = counts.reshape(out.shape)
+
+def _mandel_numpy_tiled(x_dom: np.ndarray, y_dom: np.ndarray, max_iter: int,
+                        out: np.ndarray) -> None:
+    """_mandel_numpy on square tiles, each stops as soon as its own points escaped"""
+    tiles = [(x_dom[col:col + _NUMPY_TILE], y_dom[row:row + _NUMPY_TILE], max_iter,
+              out[row:row + _NUMPY_TILE, col:col + _NUMPY_TILE])
+             for row in range(0, len(y_dom), _NUMPY_TILE)
+             for col in range(0, len(x_dom), _NUMPY_TILE)]
+
+    if len(tiles) == 1:
+        _mandel_numpy(*tiles[0])
+    else:
+        _get_thread_pool().starmap(_mandel_numpy, tiles)
+
+def _compute_tile(task: tuple[int, tuple]) -> tuple[int, tuple[int, np.ndarray]]:
+    """Runs compute_pixel_batch for one tile, keeping the task index"""
+    task_idx, args = task
+    return task_idx, compute_pixel_batch(args)
+
+def _get_pool():
+    """Returns the persistent worker pool, starting it on first use"""
+    global _POOL
+
+    if _POOL is None:
+        _POOL = _MP_CONTEXT.Pool(processes=max(1, cpu_count() - 1))  # one core free for UI
+        atexit.register(_close_pool)
+
+    return _POOL
+
+def _get_thread_pool():
+    """Returns the persistent thread pool of the NumPy path, starting it on first use"""
+    global _THREAD_POOL
+
+    if _THREAD_POOL is None:
+        _THREAD_POOL = ThreadPool(processes=cpu_count())
+        atexit.register(_close_thread_pool)
+
+    return _THREAD_POOL
+
+def _close_thread_pool() -> None:
+    """Stops the thread pool"""
+    global _THREAD_POOL
+
+    if _THREAD_POOL is not None:
+        _THREAD_POOL.close()
+        _THREAD_POOL.join()
+        _THREAD_POOL = None
+
+def _close_pool() -> None:
+    """Stops the worker pool"""
+    global _POOL
+
+    if _POOL is not None:
+        _POOL.close()
+        _POOL.join()
+        _POOL = None
+
+def _scratch(shape: tuple[int, ...], dtype: type, allocate: Callable = np.empty):
+    """Returns a reused, uninitialized array for data which never leaves compute
+
+    The arrays are kept per thread and per (shape, dtype, allocate), the least
+    recently used ones are dropped past _SCRATCH_MAX_ARRAYS. The array must be
+    consumed before the next call with the same key, so it is never returned
+    to the caller or handed to Image.fromarray, which may keep it.
+    """
+    arrays = getattr(_SCRATCH, 'arrays', None)
+    if arrays is None:
+        arrays = _SCRATCH.arrays = OrderedDict()
+
+    key = (shape, np.dtype(dtype), allocate)
+    if key in arrays:
+        arrays.move_to_end(key)
+    else:
+        arrays[key] = allocate(shape, dtype)
+        if len(arrays) > _SCRATCH_MAX_ARRAYS:
+            arrays.popitem(last=False)
+
+    return arrays[key]
+
+def clear_cache() -> None:
+    """Frees the scratch arrays of this thread and the created fractal functions"""
+    _SCRATCH.arrays = OrderedDict()
+    create_fractal_function.cache_clear()
+    _compile_polynomial.cache_clear()
+
+def _to_image(pixels: np.ndarray, image: Optional[Image.Image]) -> Image.Image:
+    """Turns an RGB array into an image, writing into the given image if it fits"""
+    height, width = pixels.shape[:2]
+
+    # overwrite in place with one copy into the image's own buffer
+    if image is not None and image.size == (width, height) and image.mode == 'RGB':
+        image.frombytes(pixels.tobytes())
+        return image
+
+    return Image.fromarray(pixels, 'RGB')
+
+def _build_gradient(colormap: list[tuple[int, int, int]], max_iterations: int) -> np.ndarray:
+    """Creates the (max_iterations, 3) uint8 color lookup table
+
+    The colors of colormap are spread evenly over the iterations, with linear
+    interpolation between neighbouring colors.
+    """
+    stops = np.asarray(colormap, dtype=np.float64)
+    stop_positions = np.linspace(0.0, 1.0, len(stops))
+    positions = np.linspace(0.0, 1.0, max_iterations)
+
+    return np.stack([np.interp(positions, stop_positions, stops[:, channel]).astype(np.uint8)
+                     for channel in range(3)], axis=-1)
+
+def _view_domains(size: int, coords: tuple[float, float, float, float]
+                  ) -> tuple[np.ndarray, np.ndarray]:
+    """The real and imaginary sample points of a (x_ul, y_ul, x_dr, y_dr) view"""
+    x_ul, y_ul, x_dr, y_dr = coords
+    return np.linspace(x_ul, x_dr, size), np.linspace(y_ul, y_dr, size)
+
+def _compute_regions(
+    func_str: str,
+    max_iterations: int,
+    domains: list[tuple[np.ndarray, np.ndarray]],
+    gradient: np.ndarray,
+    fp: str,
+    device: str = 'auto'
+) -> list[np.ndarray]:
+
+    """Computes the RGB pixels of every (x_dom, y_dom) region"""
+
+    if _is_mandelbrot(func_str):
+        # the kernels run in the requested precision, eval'd functions use complex
+        dtype = FP_DTYPES[fp]
+
+        if device == 'cuda' or (device == 'auto' and CUDA_AVAILABLE
+                                and all(len(x_dom) * len(y_dom) >= _CUDA_MIN_PIXELS
+                                        for x_dom, y_dom in domains)):
+            return _compute_cuda(max_iterations, domains, gradient, dtype)
+
+        frames = []
+        for x_dom, y_dom in domains:
+            if NUMBA_AVAILABLE:
+                # only four scalars, the kernel maps pixels to coordinates itself and
+                # colors them right away, so the counts never reach memory
+                x0, dx, y0, dy = (dtype(value) for value in _domain_steps(x_dom, y_dom))
+                pixels = np.empty((len(y_dom), len(x_dom), 3), dtype=np.uint8)
+                _mandel_rgb(x0, dx, y0, dy, max_iterations, gradient, pixels)
+            else:
+                iters = _scratch((len(y_dom), len(x_dom)), np.int32)
+                _mandel_numpy_tiled(x_dom.astype(dtype), y_dom.astype(dtype), max_iterations, iters)
+                pixels = gradient[iters]
+
+            frames.append(pixels)
+
+        return frames
+
+    # polynomials are compiled instead of eval'd, always in double precision like eval
+    kernel = _compile_polynomial(func_str)
+    if kernel is not None:
+        frames = []
+        for x_dom, y_dom in domains:
+            iters = _scratch((len(y_dom), len(x_dom)), np.int32)
+            kernel(x_dom.astype(np.float64), y_dom.astype(np.float64), max_iterations, iters)
+            frames.append(gradient[iters])
+
+        return frames
+
+    # tiles of all the regions go to the pool at once
+    worker_args = []
+    worker_frames = []
+    for frame_idx, (x_dom, y_dom) in enumerate(domains):
+        # tiles of rows small enough for a worker to keep its working set in L2
+        tile_rows = max(_MIN_TILE_ROWS, _L2_CACHE_BYTES // max(1, len(x_dom) * _BYTES_PER_PIXEL))
+
+        for start_row in range(0, len(y_dom), tile_rows):
+            end_row = min(start_row + tile_rows, len(y_dom))
+
+            worker_args.append((start_row, end_row, x_dom, y_dom, func_str, max_iterations))
+            worker_frames.append(frame_idx)
+
+    # parallel processing, tiles are placed in whatever order they finish
+    if sum(len(x_dom) * len(y_dom) for x_dom, y_dom in domains) <= _INLINE_MAX_PIXELS:
+        results = map(_compute_tile, enumerate(worker_args))
+    else:
+        results = _get_pool().imap_unordered(_compute_tile, enumerate(worker_args))
+
+    # assemble the tiles of the workers
+    iters = [np.empty((len(y_dom), len(x_dom)), dtype=np.int32) for x_dom, y_dom in domains]
+    for task_idx, (start_row, strip) in results:
+        iters[worker_frames[task_idx]][start_row:start_row + len(strip)] = strip
+
+    # colored once per region in the parent
+    return [gradient[region_iters] for region_iters in iters]
+
+def _grid_offset(
+    size: int,
+    prev_coords: tuple[float, float, float, float],
+    coords: tuple[float, float, float, float]
+) -> Optional[tuple[int, int]]:
+
+    """Pixel shift of a view in the grid of the previous one, None if they don't line up"""
+
+    if size < 2:
+        return None
+
+    prev_dx = (prev_coords[2] - prev_coords[0]) / (size - 1)
+    prev_dy = (prev_coords[3] - prev_coords[1]) / (size - 1)
+    dx = (coords[2] - coords[0]) / (size - 1)
+    dy = (coords[3] - coords[1]) / (size - 1)
+
+    if not (math.isclose(dx, prev_dx, rel_tol=1e-9) and math.isclose(dy, prev_dy, rel_tol=1e-9)):
+        return None
+
+    col_shift = (coords[0] - prev_coords[0]) / dx
+    row_shift = (coords[1] - prev_coords[1]) / dy
+
+    if abs(col_shift - round(col_shift)) > 1e-6 or abs(row_shift - round(row_shift)) > 1e-6:
+        return None
+
+    return int(round(row_shift)), int(round(col_shift))
+
+def _compute_view(
+    func_str: str,
+    size: int,
+    max_iterations: int,
+    coords: tuple[float, float, float, float],
+    gradient: np.ndarray,
+    fp: str,
+    previous: Optional[tuple[np.ndarray, tuple[float, float, float, float]]] = None,
+    device: str = 'auto'
+) -> np.ndarray:
+
+    """Computes the RGB pixels of one view, reusing the overlap with previous"""
+
+    x_dom, y_dom = _view_domains(size, coords)
+
+    offset = None
+    if previous is not None and previous[0].shape == (size, size, 3):
+        offset = _grid_offset(size, previous[1], coords)
+
+    # the fp32 kernels step from each view's own origin in float32, so shifted
+    # pixels only match a fresh computation in fp64, unchanged views always do
+    if offset is not None and offset != (0, 0) and fp != 'fp64':
+        offset = None
+
+    if offset is None or abs(offset[0]) >= size or abs(offset[1]) >= size:
+        return _compute_regions(func_str, max_iterations, [(x_dom, y_dom)],
+                                gradient, fp, device)[0]
+
+    # rows and columns of the new view which were already in the previous one
+    row_shift, col_shift = offset
+    row_lo, row_hi = max(0, -row_shift), min(size, size - row_shift)
+    col_lo, col_hi = max(0, -col_shift), min(size, size - col_shift)
+
+    pixels = np.empty((size, size, 3), dtype=np.uint8)
+    pixels[row_lo:row_hi, col_lo:col_hi] = previous[0][row_lo + row_shift:row_hi + row_shift,
+                                                      col_lo + col_shift:col_hi + col_shift]
+
+    # the newly exposed bands, full rows above and below, columns beside
+    regions = []
+    for start, end in ((0, row_lo), (row_hi, size)):
+        if start < end:
+            regions.append(((slice(start, end), slice(0, size)), (x_dom, y_dom[start:end])))
+    for start, end in ((0, col_lo), (col_hi, size)):
+        if start < end:
+            regions.append(((slice(row_lo, row_hi), slice(start, end)),
+                            (x_dom[start:end], y_dom[row_lo:row_hi])))
+
+    computed = _compute_regions(func_str, max_iterations,
+                                [domain for _, domain in regions], gradient, fp, device)
+    for (index, _), region_pixels in zip(regions, computed):
+        pixels[index] = region_pixels
+
+    return pixels
+
+def _validate(
+    size: int,
+    max_iterations: int,
+    coords_list: list[tuple[float, float, float, float]],
+    fp: str,
+    device: str
+) -> None:
+
+    """Raises ValueError for bad arguments, before anything is allocated"""
+
+    # an image may be empty, but every pixel needs at least one iteration to be colored
+    if size < 0 or max_iterations <= 0:
+        raise ValueError('The size and max amount of iterations are positive')
+    for x_ul, y_ul, x_dr, y_dr in coords_list:
+        if x_ul >= x_dr or y_ul >= y_dr:
+            raise ValueError('Incorrect coordinates')
+    if fp != 'auto' and fp not in FP_DTYPES:
+        raise ValueError('The precision is fp32, fp64 or auto')
+    if device not in DEVICES:
+        raise ValueError('The device is auto, cpu or cuda')
+    if device == 'cuda' and not CUDA_AVAILABLE:
+        raise ValueError('There is no CUDA device')
+
+def view_precision(size: int, coords: tuple[float, float, float, float]) -> str:
+    """Chooses fp64 for deep zooms and the faster fp32 otherwise"""
+    x_ul, y_ul, x_dr, y_dr = coords
+    if size > 0 and min(x_dr - x_ul, y_dr - y_ul) / size < DEEP_ZOOM_PIXEL_SPAN:
+        return 'fp64'
+    return 'fp32'
+
+def compute_pixels(
     func_str: str = 'z**2',
     size: int = 512,
     max_iterations: int = 50,
     x_ul: float = -2.0, y_ul: float = -2.0,
     x_dr: float = 2.0, y_dr: float = 2.0,
     colormap: list[tuple[int, int, int]] = [(0, 0, 0), (0, 255, 0)],
-    image: Optional[Image.Image] = None
-) -> Image.Image:
+    fp: str = 'auto',
+    previous: Optional[tuple[np.ndarray, tuple[float, float, float, float]]] = None,
+    device: str = 'auto'
+) -> np.ndarray:
 
-    """Main function to generate fractal images"""
+    """Generates the fractal as a (size, size, 3) uint8 RGB array
+
+    fp is the precision of the z**2 kernels, 'fp32', 'fp64' or 'auto' which
+    only uses fp64 once float32 can't tell neighbouring pixels apart.
+
+    previous is the (pixels, (x_ul, y_ul, x_dr, y_dr)) of an earlier call with
+    the same function, size, iterations, colormap and precision. An unchanged
+    view is copied from it, and in fp64 so are the pixels of a shifted view
+    which line up with it.
+
+    device is where the z**2 kernels run, 'cpu', 'cuda' or 'auto' which uses
+    the GPU for views of at least 512x512 pixels if there is one.
+    """
 
     # if arguments are None
     if func_str is None:
@@ -97,47 +763,83 @@ def compute(
     if colormap is None:
         colormap = [(0, 0, 0), (0, 255, 0)]
 
-    if size < 0 or max_iterations < 0:
-        raise ValueError('The size and max amount of iterations are positive')
-    if x_ul >= x_dr or y_ul >= y_dr:
-        raise ValueError('Incorrect coordinates')
+    if fp is None:
+        fp = 'auto'
+    if device is None:
+        device = 'auto'
+
+    _validate(size, max_iterations, [(x_ul, y_ul, x_dr, y_dr)], fp, device)
 
-    # creating the color gradient
-    r = np.linspace(colormap[0][0], colormap[1][0], max_iterations)
-    g = np.linspace(colormap[0][1], colormap[1][1], max_iterations)
-    b = np.linspace(colormap[0][2], colormap[1][2], max_iterations)
+    if fp == 'auto':
+        fp = view_precision(size, (x_ul, y_ul, x_dr, y_dr))
 
-    gradient = list(zip(r.astype(int), g.astype(int), b.astype(int)))
+    gradient = _build_gradient(colormap, max_iterations)
+    return _compute_view(func_str, size, max_iterations,
+                         (x_ul, y_ul, x_dr, y_dr), gradient, fp, previous, device)
 
-    # beginning the computation
-    x_dom = np.linspace(x_ul, x_dr, size)
-    y_dom = np.linspace(y_ul, y_dr, size)
+def compute(
+    func_str: str = 'z**2',
+    size: int = 512,
+    max_iterations: int = 50,
+    x_ul: float = -2.0, y_ul: float = -2.0,
+    x_dr: float = 2.0, y_dr: float = 2.0,
+    colormap: list[tuple[int, int, int]] = [(0, 0, 0), (0, 255, 0)],
+    image: Optional[Image.Image] = None,
+    fp: str = 'auto',
+    previous: Optional[tuple[np.ndarray, tuple[float, float, float, float]]] = None,
+    device: str = 'auto'
+) -> Image.Image:
 
-    if image is None:
-        image = Image.new('RGB', (size, size), color='black')
+    """Main function to generate fractal images, see compute_pixels"""
 
-    # preparing arguments for parallel processing
-    num_workers = max(1, cpu_count() - 1)  # one core free for UI
-    rows_per_worker = math.ceil(size / num_workers)
+    pixels = compute_pixels(func_str, size, max_iterations, x_ul, y_ul,
+                            x_dr, y_dr, colormap, fp, previous, device)
+    return _to_image(pixels, image)
 
-    # batches
-    worker_args = []
-    for worker_idx in range(num_workers):
-        start_row = worker_idx * rows_per_worker
-        end_row = min((worker_idx + 1) * rows_per_worker, size)
+def compute_batch(
+    func_str: str,
+    size: int,
+    max_iterations: int,
+    coords_list: list[tuple[float, float, float, float]],
+    colormap: list[tuple[int, int, int]],
+    fp: str = 'auto',
+    device: str = 'auto'
+) -> list[Image.Image]:
+
+    """Generates one fractal image per (x_ul, y_ul, x_dr, y_dr) view
+
+    Repeated views are only computed once and share one image.
+    """
+
+    # if arguments are None
+    if func_str is None:
+        func_str = 'z**2'
+    if size is None:
+        size = 512
+    if max_iterations is None:
+        max_iterations = 50
+    if colormap is None:
+        colormap = [(0, 0, 0), (0, 255, 0)]
+    if fp is None:
+        fp = 'auto'
+    if device is None:
+        device = 'auto'
 
-        if start_row >= size:
-            break
+    _validate(size, max_iterations, coords_list, fp, device)
 
-        worker_args.append((start_row, end_row, x_dom, y_dom, func_str, max_iterations, gradient))
+    # the deepest view decides, all the frames share one precision
+    if fp == 'auto':
+        deep = any(view_precision(size, coords) == 'fp64' for coords in coords_list)
+        fp = 'fp64' if deep else 'fp32'
 
-    # parallel processing
-    with Pool(processes=num_workers) as pool:
-        results = pool.map(compute_pixel_batch, worker_args)
+    unique_coords = list(dict.fromkeys(tuple(coords) for coords in coords_list))
 
-    # update the image with the new pixels
-    for batch_result in results:
-        for row_idx, col_idx, pixel_value in batch_result:
-            image.putpixel((col_idx, row_idx), pixel_value)
+    # one gradient and one pass over the pool for all the frames
+    gradient = _build_gradient(colormap, max_iterations)
+    frames = _compute_regions(func_str, max_iterations,
+                              [_view_domains(size, coords) for coords in unique_coords],
+                              gradient, fp, device)
 
-    return image
+    images = {coords: Image.fromarray(pixels, 'RGB')
+              for coords, pixels in zip(unique_coords, frames)}
+    return [images[tuple(coords)] for coords in coords_list]
@@ -18,12 +18,14 @@ Usage:
 """
 
 import argparse
-import re
-from tkinter import Tk, Button, Canvas, filedialog, messagebox
-from functools import reduce
-from PIL import ImageTk, Image
+import ast
+from typing import Optional
+from tkinter import Tk, Button, Canvas, PhotoImage, filedialog, messagebox
+from functools import lru_cache
+from PIL import Image
 import numpy as np
-from compute import compute
+from compute import compute_pixels, compute_batch, view_precision
+
 
 # validation of the argument list because of compute() using default values
 # (if an argument is specified all previous ones shuld be too)
@@ -37,30 +39,66 @@ def validate_arguments(args_dict: dict[str, str]) -> None:
         if has_any_args is True and val is None:
             raise Exception('If a command line argument is present all previous ones, in the order provided by the --help command must be present too')
 
+# names and dotted names a fractal expression may refer to
+ALLOWED_NAMES = frozenset({
+    'z', # this is the complex argument
+    'abs'
+})
+ALLOWED_ATTRIBUTES = frozenset({
+    'cmath.sin',
+    'cmath.cos',
+    'cmath.tan',
+    'cmath.exp',
+    'cmath.log',
+    'cmath.sqrt',
+    'cmath.pi',
+    'cmath.e',
+    'cmath.phase',
+    'math.floor',
+    'math.ceil',
+    'math.trunc'
+})
+
+# syntax nodes of plain arithmetic, anything else (strings, subscripts,
+# lambdas, keyword arguments...) is rejected
+ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name,
+                 ast.Attribute, ast.Constant, ast.Load, ast.operator, ast.unaryop)
+
+def _dotted(node: ast.Attribute) -> Optional[str]:
+    """Dotted name of an attribute chain such as cmath.sin, None if not name.attr"""
+    if isinstance(node.value, ast.Name):
+        return f'{node.value.id}.{node.attr}'
+    return None
+
+def _is_allowed(node: ast.AST) -> bool:
+    """Recursively checks a parsed expression against the allow-lists"""
+    if not isinstance(node, ALLOWED_NODES):
+        return False
+
+    if isinstance(node, ast.Name):
+        return node.id in ALLOWED_NAMES
+    if isinstance(node, ast.Attribute):
+        # the whole dotted name is checked, its inner Name is not a free name
+        return _dotted(node) in ALLOWED_ATTRIBUTES
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, (int, float, complex)) and not isinstance(node.value, bool)
+
+    return all(_is_allowed(child) for child in ast.iter_child_nodes(node))
+
 # the lambda function could execute ANY code if not verified
+@lru_cache(maxsize=128)
 def verify_func_not_malicious(func: str) -> bool:
     """Security check for fractal expressions"""
-    allowed_functions = [
-        'z', # this is the complex argument
-        'abs',
-        'cmath.sin',
-        'cmath.cos',
-        'cmath.tan',
-        'cmath.exp',
-        'cmath.log',
-        'cmath.sqrt',
-        'cmath.pi',
-        'cmath.e',
-        'cmath.phase',
-        'math.floor',
-        'math.ceil',
-        'math.trunc'
-    ]
-
-    # matches words and 2 words separated by a dot (but not complex numbers)
-    words = re.findall(r'\b[a-z]+(?:\.[a-z]+)?\b(?!j\b)', func, re.IGNORECASE)
-
-    return reduce(lambda acc, word: acc and word in allowed_functions, words, True)
+    # an empty expression makes the fractal function just + c
+    if not func.strip():
+        return True
+
+    try:
+        tree = ast.parse(func, mode='eval')
+    except SyntaxError:
+        return False
+
+    return _is_allowed(tree)
 
 class FractalApp:
     """Main class for the program"""
@@ -87,10 +125,15 @@ class FractalApp:
         self.selection_end = None
         self.selection_rect = None
 
-        # current image and PhotoImage
-        self.image = None
+        # current pixels and PhotoImage
+        self.pixels = None
         self.tk_image = None
 
+        # pixels and (view, precision) of the last computed fractal, compute_pixels
+        # copies an unchanged view, and in fp64 one shifted by whole pixels
+        self._prev_pixels = None
+        self._prev_rect = None
+
         # frames for GIF creation
         self.frames = []
         self.frames_coords = []
@@ -261,7 +304,13 @@ class FractalApp:
     def update_fractal(self) -> None:
         """Updates the image"""
         try:
-            self.image = compute(
+            fp = view_precision(self.size, (self.x_ul, self.y_ul, self.x_dr, self.y_dr))
+
+            previous = None
+            if self._prev_pixels is not None and self._prev_rect[1] == fp:
+                previous = (self._prev_pixels, self._prev_rect[0])
+
+            self.pixels = compute_pixels(
                 func_str=self.func_str,
                 size=self.size,
                 max_iterations=self.iters,
@@ -270,10 +319,17 @@ class FractalApp:
                 x_dr=self.x_dr,
                 y_dr=self.y_dr,
                 colormap=list(self.colormap),
-                image=self.image
+                fp=fp,
+                previous=previous
             )
 
-            self.tk_image = ImageTk.PhotoImage(self.image)
+            self._prev_pixels = self.pixels
+            self._prev_rect = ((self.x_ul, self.y_ul, self.x_dr, self.y_dr), fp)
+
+            # Tk reads binary PPM directly, which skips the PIL round trip
+            height, width = self.pixels.shape[:2]
+            header = f'P6 {width} {height} 255\n'.encode()
+            self.tk_image = PhotoImage(data=header + self.pixels.tobytes(), format='PPM')
 
             self.canvas.delete('all')
             self.canvas.create_image(0, 0, anchor='nw', image=self.tk_image)
@@ -286,10 +342,9 @@ class FractalApp:
 
     def save_frame(self) -> None:
         """Saves the frame to the list of frames"""
-        if self.image:
-            # copy current image
-            frame_copy = self.image.copy()
-            self.frames.append(frame_copy)
+        if self.pixels is not None:
+            # compute_pixels returns a new array for every view, so it is not copied
+            self.frames.append(Image.fromarray(self.pixels))
             self.frames_coords.append((self.x_ul, self.y_ul, self.x_dr, self.y_dr))
             print(f'Frame saved. Total frames: {len(self.frames)}')
 
@@ -310,38 +365,37 @@ class FractalApp:
 
         if file_path:
             try:
-                # make intermediate frames
-                save_list = []
+                # coordinates of the intermediate frames between saved frames, the
+                # first and last of the 7 steps are the saved frames themselves
+                coords_list = []
                 for j in range(len(self.frames) - 1):
-                    save_list.append(self.frames[j].copy())
-
                     x0_tuple = list(np.linspace(self.frames_coords[j][0],
-                                                self.frames_coords[j + 1][0], 7))
+                                                self.frames_coords[j + 1][0], 7))[1:-1]
                     y0_tuple = list(np.linspace(self.frames_coords[j][1],
-                                                self.frames_coords[j + 1][1], 7))
+                                                self.frames_coords[j + 1][1], 7))[1:-1]
                     x1_tuple = list(np.linspace(self.frames_coords[j][2],
-                                                self.frames_coords[j + 1][2], 7))
+                                                self.frames_coords[j + 1][2], 7))[1:-1]
                     y1_tuple = list(np.linspace(self.frames_coords[j][3],
-                                                self.frames_coords[j + 1][3], 7))
-                    coords_tuple = zip(x0_tuple, y0_tuple, x1_tuple, y1_tuple)
-
-                    img = Image.new('RGB', (self.size, self.size), color='black')
-
-                    for x0, y0, x1, y1 in coords_tuple:
-                        compute(
-                            func_str=self.func_str,
-                            size=self.size,
-                            max_iterations=self.iters,
-                            x_ul=x0,
-                            y_ul=y0,
-                            x_dr=x1,
-                            y_dr=y1,
-                            colormap=list(self.colormap),
-                            image=img
-                        )
-                        save_list.append(img.copy())
-
-                save_list.append(self.frames[len(self.frames) - 1].copy())
+                                                self.frames_coords[j + 1][3], 7))[1:-1]
+                    coords_list.extend(zip(x0_tuple, y0_tuple, x1_tuple, y1_tuple))
+
+                # all intermediate frames are computed in one batch
+                intermediate = compute_batch(
+                    func_str=self.func_str,
+                    size=self.size,
+                    max_iterations=self.iters,
+                    coords_list=coords_list,
+                    colormap=list(self.colormap)
+                )
+
+                # make intermediate frames
+                save_list = []
+                for j in range(len(self.frames) - 1):
+                    save_list.extend([self.frames[j], self.frames[j]])
+                    save_list.extend(intermediate[5 * j:5 * (j + 1)])
+                    save_list.append(self.frames[j + 1])
+
+                save_list.append(self.frames[len(self.frames) - 1])
 
                 print('balls')
 
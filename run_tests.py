@@ -7,13 +7,15 @@ import unittest
 import sys
 import os
 
+# the test modules import main and compute from the project directory
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
 def run_all_tests():
     """Discover and run all tests."""
-    # add the current directory to the path
-    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, PROJECT_DIR)
     
     test_loader = unittest.TestLoader()
-    test_suite = test_loader.discover(start_dir='.', pattern='test_*.py')
+    test_suite = test_loader.discover(start_dir=PROJECT_DIR, pattern='test_*.py')
     
     # run tests
     test_runner = unittest.TextTestRunner(verbosity=2)
@@ -23,10 +25,12 @@ def run_all_tests():
 
 def run_specific_test(test_name):
     """Run a specific test module or test case."""
+    sys.path.insert(0, PROJECT_DIR)
+    
     test_loader = unittest.TestLoader()
     
     if test_name.endswith('.py'):
-        test_suite = test_loader.discover('.', pattern=test_name)
+        test_suite = test_loader.discover(PROJECT_DIR, pattern=test_name)
     else:
         try:
             test_suite = test_loader.loadTestsFromName(test_name)
@@ -4,20 +4,25 @@ Unit tests for compute.py module.
 """
 
 import unittest
-from unittest.mock import patch, MagicMock
-import sys
-import os
+import cmath
+from unittest.mock import patch
 import numpy as np
 from PIL import Image
 
-# Add the parent directory to the path to import compute
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
+import compute as compute_module
 from compute import (
     default_fractal_function,
     create_fractal_function,
     compute_pixel_batch,
-    compute
+    compute,
+    compute_pixels,
+    compute_batch,
+    view_precision,
+    _build_gradient,
+    _escape_count,
+    _mandel_rgb,
+    _mandel_numpy,
+    _mandel_numpy_tiled
 )
 
 
@@ -58,6 +63,12 @@ class TestCreateFractalFunction(unittest.TestCase):
         # (1+1j)² + 1 = (1 + 2j - 1) + 1 = 2j + 1 = 1 + 2j
         self.assertEqual(result, 1 + 2j)
     
+    def test_create_function_cached(self):
+        """Test that the same string reuses the created function."""
+        self.assertIs(create_fractal_function('z**3'), create_fractal_function('z**3'))
+        self.assertIs(create_fractal_function('z**2'), default_fractal_function)
+        self.assertIs(create_fractal_function(' z ** 2 '), default_fractal_function)
+    
     def test_create_invalid_function(self):
         """Test that invalid functions fall back to default."""
         # Invalid expression
@@ -70,13 +81,20 @@ class TestCreateFractalFunction(unittest.TestCase):
     
     def test_create_function_with_cmath(self):
         """Test functions using cmath functions."""
-        # Note: In the actual implementation, eval doesn't have cmath imported
-        # This test shows what we'd expect if cmath was available
         func = create_fractal_function('z')
         result = func(3+4j, 1+1j)
         # z + c = (3+4j) + (1+1j) = 4+5j
         self.assertEqual(result, 4+5j)
 
+        func = create_fractal_function('cmath.sin(z)')
+        self.assertEqual(func(3+4j, 1+1j), cmath.sin(3+4j) + (1+1j))
+
+    def test_create_function_without_builtins(self):
+        """Test that functions cannot reach the builtins."""
+        func = create_fractal_function('__import__("os").getpid()')
+        with self.assertRaises(NameError):
+            func(1+1j, 1+1j)
+
 
 class TestComputePixelBatch(unittest.TestCase):
     """Test the compute_pixel_batch function."""
@@ -89,45 +107,188 @@ class TestComputePixelBatch(unittest.TestCase):
         self.func_str = 'z**2'
         self.max_iterations = 10
         
-        # Create a simple gradient
-        self.gradient = [(0, 0, 0)] * self.max_iterations
-        for i in range(self.max_iterations):
-            self.gradient[i] = (i * 25, i * 25, i * 25)
+        # Create a simple gray gradient lookup table
+        self.gradient = (np.arange(self.max_iterations)[:, None] * 25).repeat(3, axis=1).astype(np.uint8)
     
     def test_compute_pixel_batch_basic(self):
         """Test basic batch computation."""
         args = (0, 2, self.x_values, self.y_values, 
-                self.func_str, self.max_iterations, self.gradient)
+                self.func_str, self.max_iterations)
         
-        results = compute_pixel_batch(args)
+        start_row, strip = compute_pixel_batch(args)
         
-        # Should have 2 rows * 4 columns = 8 results
-        self.assertEqual(len(results), 8)
+        # Should cover rows 0 and 1 of the 4 columns
+        self.assertEqual(start_row, 0)
+        self.assertEqual(strip.shape, (2, 4))
+        self.assertEqual(strip.dtype, np.int32)
         
-        # Each result should be a tuple of (row, col, color)
-        for result in results:
-            self.assertIsInstance(result, tuple)
-            self.assertEqual(len(result), 3)
-            row, col, color = result
-            self.assertIsInstance(row, int)
-            self.assertIsInstance(col, int)
-            self.assertIsInstance(color, tuple)
-            self.assertEqual(len(color), 3)
+        # Every count should index the gradient
+        self.assertTrue(((strip >= 0) & (strip < self.max_iterations)).all())
+        self.assertEqual(self.gradient[strip].shape, (2, 4, 3))
     
     def test_compute_pixel_batch_div_zero(self):
         """Test that division by zero doesn't crash."""
         # Use a function that might cause division by zero
         args = (0, 1, self.x_values, self.y_values, 
-                '1/z', self.max_iterations, self.gradient)
+                '1/z', self.max_iterations)
         
         # Should not raise an exception
         try:
-            results = compute_pixel_batch(args)
+            _, strip = compute_pixel_batch(args)
             # Should get results
-            self.assertTrue(len(results) > 0)
+            self.assertTrue(strip.size > 0)
         except ZeroDivisionError:
             self.fail("compute_pixel_batch raised ZeroDivisionError unexpectedly!")
 
+class TestMandelKernel(unittest.TestCase):
+    """Test the JIT escape-time kernel against the generic batch path."""
+
+    def setUp(self):
+        """Set up a small grid which contains escaping and bounded points."""
+        self.size = 8
+        self.max_iterations = 20
+        self.x_values = np.linspace(-2, 2, self.size)
+        self.y_values = np.linspace(-2, 2, self.size)
+        self.gradient = (np.arange(self.max_iterations)[:, None] * [1, 2, 3]).astype(np.uint8)
+
+    def kernel_iters(self, dtype=np.float64):
+        """Runs the kernel on the setUp grid, with a gradient which colors every count by itself."""
+        step = dtype(4.0 / (self.size - 1))
+        identity = np.repeat(np.arange(self.max_iterations, dtype=np.uint8)[:, None], 3, axis=1)
+        pixels = np.empty((self.size, self.size, 3), dtype=np.uint8)
+        _mandel_rgb(dtype(-2.0), step, dtype(-2.0), step, self.max_iterations, identity, pixels)
+        return pixels[:, :, 0].astype(np.int32)
+
+    def test_kernel_matches_pixel_batch(self):
+        """Test that the kernel counts every pixel like compute_pixel_batch."""
+        iters = self.kernel_iters()
+
+        # the vectorized z**2 path and the eval'd complex function
+        for func_str in ['z**2', 'z*z*1']:
+            with self.subTest(func_str=func_str):
+                args = (0, self.size, self.x_values, self.y_values,
+                        func_str, self.max_iterations)
+
+                _, strip = compute_pixel_batch(args)
+                self.assertTrue(np.array_equal(strip, iters))
+
+    def test_kernel_never_escaping_points(self):
+        """Test that points inside the set get the first gradient color."""
+        # cardioid, origin, period-2 bulb and a bounded point outside both
+        x_values = np.array([-0.5, 0.0, -1.0, -1.3])
+        y_values = np.array([0.0])
+        expected = np.zeros((1, 4), dtype=np.int32)
+
+        for x in x_values:
+            self.assertEqual(_escape_count(x, 0.0, self.max_iterations), 0)
+
+        iters = np.empty((1, 4), dtype=np.int32)
+        _mandel_numpy(x_values, y_values, self.max_iterations, iters)
+        self.assertTrue(np.array_equal(iters, expected))
+
+    def test_numpy_matches_kernel(self):
+        """Test that the vectorized NumPy path counts like the kernel."""
+        expected = self.kernel_iters()
+
+        iters = np.empty((self.size, self.size), dtype=np.int32)
+        _mandel_numpy(self.x_values, self.y_values, self.max_iterations, iters)
+
+        self.assertTrue(np.array_equal(iters, expected))
+
+    def test_rgb_kernel_matches_gradient_lookup(self):
+        """Test that the fused kernel colors every pixel like the counts' gradient lookup."""
+        for dtype in [np.float32, np.float64]:
+            with self.subTest(dtype=dtype.__name__):
+                step = dtype(4.0 / (self.size - 1))
+                pixels = np.empty((self.size, self.size, 3), dtype=np.uint8)
+                _mandel_rgb(dtype(-2.0), step, dtype(-2.0), step, self.max_iterations,
+                            self.gradient, pixels)
+
+                self.assertTrue(np.array_equal(pixels, self.gradient[self.kernel_iters(dtype)]))
+
+    def test_numpy_tiles_match_whole_view(self):
+        """Test that the tiled NumPy path counts like one untiled pass."""
+        # not a multiple of the tile size, so the last tiles are partial
+        x_values = np.linspace(-2, 1, 150)
+        y_values = np.linspace(-1.5, 1.5, 130)
+
+        expected = np.empty((130, 150), dtype=np.int32)
+        _mandel_numpy(x_values, y_values, self.max_iterations, expected)
+
+        iters = np.empty((130, 150), dtype=np.int32)
+        _mandel_numpy_tiled(x_values, y_values, self.max_iterations, iters)
+
+        self.assertTrue(np.array_equal(iters, expected))
+
+    def test_compute_fast_path_matches_fallback(self):
+        """Test that compute() renders the same image with and without numba."""
+        fast = compute(size=16, max_iterations=self.max_iterations, fp='fp64')
+
+        with patch.object(compute_module, 'NUMBA_AVAILABLE', False):
+            slow = compute(size=16, max_iterations=self.max_iterations, fp='fp64')
+
+        self.assertEqual(fast.tobytes(), slow.tobytes())
+
+    def test_kernel_precisions_agree(self):
+        """Test that fp32 and fp64 views give the same counts on a coarse grid."""
+        iters32 = self.kernel_iters(np.float32)
+        iters64 = self.kernel_iters(np.float64)
+
+        self.assertTrue(np.array_equal(iters32, iters64))
+
+    def test_compute_invalid_precision(self):
+        """Test that an unknown precision raises ValueError."""
+        with self.assertRaises(ValueError):
+            compute(size=8, fp='fp16')
+
+    def test_auto_precision(self):
+        """Test that auto precision only switches to fp64 for deep zooms."""
+        self.assertEqual(view_precision(512, (-2.0, -2.0, 2.0, 2.0)), 'fp32')
+        self.assertEqual(view_precision(512, (-0.75, 0.1, -0.75 + 1e-4, 0.1 + 1e-4)), 'fp64')
+
+        # a patch of the seahorse valley where float32 already loses detail
+        deep = dict(size=16, max_iterations=300,
+                    x_ul=-0.743643887, y_ul=0.131825904,
+                    x_dr=-0.743643887 + 1e-5, y_dr=0.131825904 + 1e-5)
+        self.assertEqual(compute(**deep).tobytes(), compute(fp='fp64', **deep).tobytes())
+        self.assertNotEqual(compute(**deep).tobytes(), compute(fp='fp32', **deep).tobytes())
+
+    @unittest.skipUnless(compute_module.CUDA_AVAILABLE, 'needs a CUDA device')
+    def test_cuda_matches_kernel(self):
+        """Test that the GPU path colors every pixel like the CPU kernel."""
+        domains = [(self.x_values, self.y_values)]
+        iters = self.kernel_iters()
+        pixels = compute_module._compute_cuda(self.max_iterations, domains,
+                                              self.gradient, np.float64)[0]
+
+        self.assertTrue(np.array_equal(pixels, self.gradient[iters]))
+
+    @unittest.skipUnless(compute_module.CUDA_AVAILABLE, 'needs a CUDA device')
+    def test_compute_on_cuda_matches_cpu(self):
+        """Test that forcing the GPU gives the pixels of the CPU path, even for small views."""
+        gpu = compute(size=16, max_iterations=self.max_iterations, fp='fp64', device='cuda')
+        cpu = compute(size=16, max_iterations=self.max_iterations, fp='fp64', device='cpu')
+
+        self.assertEqual(gpu.tobytes(), cpu.tobytes())
+
+    @unittest.skipIf(compute_module.CUDA_AVAILABLE, 'has a CUDA device')
+    def test_compute_on_missing_cuda(self):
+        """Test that forcing the GPU without one raises ValueError."""
+        with self.assertRaises(ValueError):
+            compute(size=8, device='cuda')
+
+    def test_compute_invalid_device(self):
+        """Test that an unknown device raises ValueError."""
+        with self.assertRaises(ValueError):
+            compute(size=8, device='tpu')
+        with self.assertRaises(ValueError):
+            compute_batch('z**2', 8, 10, [(-2.0, -2.0, 2.0, 2.0)], None, device='tpu')
+
+    def test_compute_zero_size(self):
+        """Test that an empty image is produced for size 0."""
+        img = compute(size=0)
+        self.assertEqual(img.size, (0, 0))
+
 class TestComputeFunction(unittest.TestCase):
     """Test the main compute function."""
     
@@ -154,10 +315,8 @@ class TestComputeFunction(unittest.TestCase):
         
         # Check that image is not all one color
         # (fractal should have some variation)
-        colors = set()
-        for x in range(min(5, self.small_size)):
-            for y in range(min(5, self.small_size)):
-                colors.add(img.getpixel((x, y)))
+        corner = np.asarray(img)[:5, :5]
+        colors = {tuple(pixel) for pixel in corner.reshape(-1, 3)}
         
         # In a proper fractal, we should have multiple colors
         # But for small size/iterations, might be limited
@@ -185,12 +344,33 @@ class TestComputeFunction(unittest.TestCase):
         
         self.assertIsInstance(img, Image.Image)
         self.assertEqual(img.size, (self.small_size, self.small_size))
+        self.assertIs(img, test_img)
         
         # The image should be modified (not all white anymore)
         # Get a pixel value
         pixel = img.getpixel((0, 0))
         self.assertNotEqual(pixel, (255, 255, 255))
     
+    def test_compute_with_mismatched_image(self):
+        """Test that an image of another size or mode is replaced, not written."""
+        for test_img in [Image.new('RGB', (4, 4)), Image.new('L', (self.small_size, self.small_size))]:
+            with self.subTest(size=test_img.size, mode=test_img.mode):
+                img = compute(size=self.small_size, max_iterations=self.test_iterations,
+                              image=test_img)
+
+                self.assertIsNot(img, test_img)
+                self.assertEqual(img.size, (self.small_size, self.small_size))
+                self.assertEqual(img.mode, 'RGB')
+
+    def test_compute_pixels_matches_compute(self):
+        """Test that compute_pixels returns the pixels of the compute image."""
+        pixels = compute_pixels(size=self.small_size, max_iterations=self.test_iterations)
+        img = compute(size=self.small_size, max_iterations=self.test_iterations)
+
+        self.assertEqual(pixels.shape, (self.small_size, self.small_size, 3))
+        self.assertEqual(pixels.dtype, np.uint8)
+        np.testing.assert_array_equal(pixels, np.asarray(img))
+    
     def test_compute_with_none_arguments(self):
         """Test compute when None arguments are passed."""
         img = compute(
@@ -215,6 +395,10 @@ class TestComputeFunction(unittest.TestCase):
         # Negative iterations
         with self.assertRaises(ValueError):
             compute(max_iterations=-10)
+
+        # No iterations
+        with self.assertRaises(ValueError):
+            compute(max_iterations=0)
         
         # Invalid coordinates (x_ul >= x_dr)
         with self.assertRaises(ValueError):
@@ -237,6 +421,39 @@ class TestComputeFunction(unittest.TestCase):
             )
             self.assertIsInstance(img, Image.Image)
             self.assertEqual(img.size, (8, 8))
+
+    def test_pool_matches_inline(self):
+        """Test that the worker pool colors pixels like the in-process path of small images."""
+        inline = compute(func_str='cmath.cos(z)', size=16, max_iterations=10)
+        with patch.object(compute_module, '_INLINE_MAX_PIXELS', 0):
+            pooled = compute(func_str='cmath.cos(z)', size=16, max_iterations=10)
+
+        self.assertEqual(inline.tobytes(), pooled.tobytes())
+
+    @unittest.skipUnless(compute_module.NUMBA_AVAILABLE, 'needs numba')
+    def test_compiled_polynomial_matches_pixel_batch(self):
+        """Test that compiled polynomials count every pixel like the eval'd function."""
+        x_values = np.linspace(-2, 2, 16)
+        y_values = np.linspace(-1.5, 1.5, 12)
+
+        # the last one overflows int64, so its integers have to be compiled as floats
+        functions = ['z', 'z**3', 'z**2 - 1', '2*z**4 + (0.3-0.2j)*z', '100000*100000*100000*100000*z*c']
+        for func_str in functions:
+            with self.subTest(func_str=func_str):
+                kernel = compute_module._compile_polynomial(func_str)
+                self.assertIsNotNone(kernel)
+
+                iters = np.empty((12, 16), dtype=np.int32)
+                kernel(x_values, y_values, 20, iters)
+
+                _, strip = compute_pixel_batch((0, 12, x_values, y_values, func_str, 20))
+                self.assertTrue(np.array_equal(iters, strip))
+
+    def test_non_polynomials_are_not_compiled(self):
+        """Test that anything but whole powers of z and c is left to eval."""
+        for func_str in ['cmath.sin(z)', 'z/2', 'z**0.5', 'z**-1', '2**z', 'abs(z)', 'z.real', 'True*z']:
+            with self.subTest(func_str=func_str):
+                self.assertIsNone(compute_module._compile_polynomial(func_str))
     
     def test_compute_color_gradient(self):
         """Test that color gradient is applied correctly."""
@@ -259,6 +476,125 @@ class TestComputeFunction(unittest.TestCase):
         self.assertAlmostEqual(g, 0, delta=5)
         self.assertAlmostEqual(b, 0, delta=5)
 
+    def test_multi_color_gradient(self):
+        """Test that a colormap with more than two colors passes through each."""
+        colormap = [(0, 0, 0), (255, 0, 0), (0, 0, 255)]
+
+        gradient = _build_gradient(colormap, 5)
+
+        self.assertEqual(gradient.shape, (5, 3))
+        self.assertEqual(gradient.dtype, np.uint8)
+        self.assertEqual([tuple(color) for color in gradient[::2]], colormap)
+        self.assertEqual(tuple(gradient[1]), (127, 0, 0))
+
+class TestComputePrevious(unittest.TestCase):
+    """Test reusing the pixels of a previous view."""
+
+    def test_shifted_view_matches_full_compute(self):
+        """Test that a view shifted by whole pixels equals a fresh computation."""
+        size = 16
+        step = 4.0 / (size - 1)
+        prev_coords = (-2.0, -2.0, 2.0, 2.0)
+        coords = (-2.0 + 3*step, -2.0 - 2*step, 2.0 + 3*step, 2.0 - 2*step)
+
+        for func_str in ['z**2', 'z**3']:
+            with self.subTest(func_str=func_str):
+                prev = compute(func_str=func_str, size=size, max_iterations=10, fp='fp64')
+                reused = compute(func_str=func_str, size=size, max_iterations=10,
+                                 x_ul=coords[0], y_ul=coords[1], x_dr=coords[2], y_dr=coords[3],
+                                 fp='fp64', previous=(np.asarray(prev), prev_coords))
+                fresh = compute(func_str=func_str, size=size, max_iterations=10,
+                                x_ul=coords[0], y_ul=coords[1], x_dr=coords[2], y_dr=coords[3],
+                                fp='fp64')
+
+                self.assertEqual(reused.tobytes(), fresh.tobytes())
+
+    def test_shifted_fp32_view_matches_full_compute(self):
+        """Test that a shifted fp32 view is not assembled from float32 pixels of another origin."""
+        size = 256
+        step = 4.0 / (size - 1)
+        prev_coords = (-2.0, -2.0, 2.0, 2.0)
+        coords = (-2.0 + 5*step, -2.0 + 3*step, 2.0 + 5*step, 2.0 + 3*step)
+
+        prev = compute_pixels(size=size, max_iterations=200, fp='fp32')
+        reused = compute_pixels(size=size, max_iterations=200, x_ul=coords[0], y_ul=coords[1],
+                                x_dr=coords[2], y_dr=coords[3], fp='fp32',
+                                previous=(prev, prev_coords))
+        fresh = compute_pixels(size=size, max_iterations=200, x_ul=coords[0], y_ul=coords[1],
+                               x_dr=coords[2], y_dr=coords[3], fp='fp32')
+
+        self.assertTrue(np.array_equal(reused, fresh))
+
+    def test_same_view_is_copied(self):
+        """Test that an unchanged view is taken from the previous pixels."""
+        marker = np.full((8, 8, 3), 7, dtype=np.uint8)
+        img = compute(size=8, previous=(marker, (-2.0, -2.0, 2.0, 2.0)))
+
+        self.assertTrue(np.array_equal(np.asarray(img), marker))
+
+class TestScratchArrays(unittest.TestCase):
+    """Test the reused scratch arrays."""
+
+    def tearDown(self):
+        """Leave no cached arrays to the other tests."""
+        compute_module.clear_cache()
+
+    def test_scratch_is_reused(self):
+        """Test that the same key returns the same array until the cache is cleared."""
+        first = compute_module._scratch((4, 4), np.int32)
+        self.assertIs(compute_module._scratch((4, 4), np.int32), first)
+        self.assertIsNot(compute_module._scratch((4, 4), np.float32), first)
+
+        compute_module.clear_cache()
+        self.assertIsNot(compute_module._scratch((4, 4), np.int32), first)
+
+    def test_results_do_not_share_scratch(self):
+        """Test that a later compute leaves the pixels of an earlier one alone."""
+        with patch.object(compute_module, 'NUMBA_AVAILABLE', False):
+            first = compute_pixels(size=16, max_iterations=10)
+            expected = first.copy()
+            compute_pixels(size=16, max_iterations=10, x_ul=-1.0, x_dr=0.0)
+
+        self.assertTrue(np.array_equal(first, expected))
+
+
+class TestComputeBatch(unittest.TestCase):
+    """Test computing several views at once."""
+
+    def test_compute_batch_matches_compute(self):
+        """Test that every batch frame equals the single-view image."""
+        coords_list = [(-2.0, -2.0, 2.0, 2.0), (-1.0, -0.5, 0.0, 0.5)]
+        colormap = [(0, 0, 0), (255, 128, 0)]
+
+        for func_str in ['z**2', 'z**3']:
+            frames = compute_batch(func_str, 16, 10, coords_list, colormap)
+            self.assertEqual(len(frames), len(coords_list))
+
+            for frame, (x0, y0, x1, y1) in zip(frames, coords_list):
+                with self.subTest(func_str=func_str, coords=(x0, y0, x1, y1)):
+                    expected = compute(func_str=func_str, size=16, max_iterations=10,
+                                       x_ul=x0, y_ul=y0, x_dr=x1, y_dr=y1,
+                                       colormap=colormap)
+                    self.assertEqual(frame.tobytes(), expected.tobytes())
+
+    def test_compute_batch_repeated_views(self):
+        """Test that a repeated view is computed once and shares its image."""
+        coords_list = [(-2.0, -2.0, 2.0, 2.0), (-1.0, -0.5, 0.0, 0.5), (-2.0, -2.0, 2.0, 2.0)]
+
+        with patch.object(compute_module, '_compute_regions',
+                          wraps=compute_module._compute_regions) as regions:
+            frames = compute_batch('z**2', 16, 10, coords_list, None)
+
+        self.assertEqual(len(regions.call_args.args[2]), 2)
+        self.assertEqual(len(frames), 3)
+        self.assertIs(frames[0], frames[2])
+
+    def test_compute_batch_invalid_coordinates(self):
+        """Test that any invalid view raises before computing."""
+        with self.assertRaises(ValueError):
+            compute_batch('z**2', 16, 10, [(-2, -2, 2, 2), (1, -2, 0, 2)],
+                          [(0, 0, 0), (255, 255, 255)])
+
 class TestPerformanceAndMemory(unittest.TestCase):
     """Test performance and memory aspects."""
     
@@ -5,38 +5,60 @@ Unit tests for main.py module.
 
 import unittest
 from unittest.mock import patch, MagicMock, call
-import sys
-import os
 import argparse
-from PIL import Image, ImageTk
-
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PIL import Image
 
+# main builds its GUI on tkinter, so without it there is nothing to import
 try:
-    from tkinter import Tk
-    TKINTER_AVAILABLE = True
-except ImportError:
-    TKINTER_AVAILABLE = False
-    # Create mock Tk class
-    class MockTk:
-        def __init__(self):
-            self.title_calls = []
-            self.update_calls = []
-            self.mainloop_calls = []
-        
-        def title(self, title):
-            self.title_calls.append(title)
-        
-        def update(self):
-            self.update_calls.append(True)
-        
-        def mainloop(self):
-            self.mainloop_calls.append(True)
-    
-    Tk = MockTk
+    import tkinter  # pylint: disable=unused-import
+except ImportError as error:
+    raise unittest.SkipTest('tkinter is not available') from error
 
 from main import validate_arguments, verify_func_not_malicious, FractalApp, main
 
+SAFE_FUNCTIONS = (
+    'z**2',
+    'z**3 + z',
+    'abs(z)',
+    'cmath.sin(z)',
+    'cmath.cos(z) + cmath.sin(z)',
+    'cmath.exp(z)',
+    'cmath.log(z)',
+    'cmath.sqrt(z)',
+    'z * cmath.pi',
+    'z / cmath.e',
+    'cmath.phase(z)',
+    'math.floor(abs(z))',
+    'math.ceil(abs(z))',
+    'math.trunc(abs(z))',
+)
+
+UNSAFE_FUNCTIONS = (
+    '__import__("os").system("ls")',
+    'eval("1+1")',
+    'exec("import os")',
+    'open("test.txt", "w")',
+    'import os',
+    'os.system',
+    'subprocess.call',
+    'globals()',
+    'locals()',
+    'compile(',
+    'getattr',
+    'setattr',
+    'delattr',
+    'hasattr',
+)
+
+FRACTAL_FUNCTIONS = (
+    'z**2',  # Mandelbrot
+    'z**3 - 1',
+    'z**4',
+    'cmath.sin(z)**2',
+    'cmath.cos(z * cmath.pi)',
+    'cmath.exp(z) - 1',
+)
+
 class TestValidateArguments(unittest.TestCase):
     """Test the validate_arguments function."""
     
@@ -52,10 +74,7 @@ class TestValidateArguments(unittest.TestCase):
         }
         
         # Should not raise any exception
-        try:
-            validate_arguments(args)
-        except Exception as e:
-            self.fail(f"validate_arguments raised {type(e).__name__} unexpectedly: {e}")
+        validate_arguments(args)
     
     def test_validate_arguments_none_at_end(self):
         """Test with None at the end (should be valid)."""
@@ -69,10 +88,7 @@ class TestValidateArguments(unittest.TestCase):
         }
         
         # Should not raise any exception (None at end is OK)
-        try:
-            validate_arguments(args)
-        except Exception as e:
-            self.fail(f"validate_arguments raised {type(e).__name__} unexpectedly: {e}")
+        validate_arguments(args)
     
     def test_validate_arguments_invalid_missing_middle(self):
         """Test with missing argument in the middle (should raise Exception)."""
@@ -101,20 +117,14 @@ class TestValidateArguments(unittest.TestCase):
         }
         
         # Should not raise any exception
-        try:
-            validate_arguments(args)
-        except Exception as e:
-            self.fail(f"validate_arguments raised {type(e).__name__} unexpectedly: {e}")
+        validate_arguments(args)
     
     def test_validate_arguments_empty_dict(self):
         """Test with empty dictionary."""
         args = {}
         
         # Should not raise any exception
-        try:
-            validate_arguments(args)
-        except Exception as e:
-            self.fail(f"validate_arguments raised {type(e).__name__} unexpectedly: {e}")
+        validate_arguments(args)
 
 
 class TestVerifyFuncNotMalicious(unittest.TestCase):
@@ -122,24 +132,7 @@ class TestVerifyFuncNotMalicious(unittest.TestCase):
     
     def test_verify_safe_functions(self):
         """Test that safe mathematical functions pass verification."""
-        safe_functions = [
-            'z**2',
-            'z**3 + z',
-            'abs(z)',
-            'cmath.sin(z)',
-            'cmath.cos(z) + cmath.sin(z)',
-            'cmath.exp(z)',
-            'cmath.log(z)',
-            'cmath.sqrt(z)',
-            'z * cmath.pi',
-            'z / cmath.e',
-            'cmath.phase(z)',
-            'math.floor(abs(z))',
-            'math.ceil(abs(z))',
-            'math.trunc(abs(z))'
-        ]
-        
-        for func in safe_functions:
+        for func in SAFE_FUNCTIONS:
             with self.subTest(func=func):
                 self.assertTrue(
                     verify_func_not_malicious(func),
@@ -148,24 +141,7 @@ class TestVerifyFuncNotMalicious(unittest.TestCase):
     
     def test_verify_unsafe_functions(self):
         """Test that unsafe/blacklisted functions fail verification."""
-        unsafe_functions = [
-            '__import__("os").system("ls")',
-            'eval("1+1")',
-            'exec("import os")',
-            'open("test.txt", "w")',
-            'import os',
-            'os.system',
-            'subprocess.call',
-            'globals()',
-            'locals()',
-            'compile(',
-            'getattr',
-            'setattr',
-            'delattr',
-            'hasattr'
-        ]
-        
-        for func in unsafe_functions:
+        for func in UNSAFE_FUNCTIONS:
             with self.subTest(func=func):
                 self.assertFalse(
                     verify_func_not_malicious(func),
@@ -186,24 +162,96 @@ class TestVerifyFuncNotMalicious(unittest.TestCase):
         
         # Just 'z'
         self.assertTrue(verify_func_not_malicious('z'))
+        
+        # Allowed words in a position the parser doesn't allow
+        self.assertFalse(verify_func_not_malicious('abs.z**2'))
+        self.assertFalse(verify_func_not_malicious('z.real'))
+        
+        # Non-numeric constants and keyword arguments
+        self.assertFalse(verify_func_not_malicious('"z" * 2'))
+        self.assertFalse(verify_func_not_malicious('abs(z, key=z)'))
     
     def test_verify_real_world_examples(self):
         """Test with real-world fractal function examples."""
-        fractal_functions = [
-            'z**2',  # Mandelbrot
-            'z**3 - 1',
-            'z**4',
-            'cmath.sin(z)**2',
-            'cmath.cos(z * cmath.pi)',
-            'cmath.exp(z) - 1'
-        ]
-        
-        for func in fractal_functions:
+        for func in FRACTAL_FUNCTIONS:
             with self.subTest(func=func):
                 self.assertTrue(
                     verify_func_not_malicious(func),
                     f"Valid fractal function '{func}' was incorrectly flagged"
                 )
 
+class TestFractalApp(unittest.TestCase):
+    """Test FractalApp with the Tk widgets mocked out."""
+
+    def setUp(self):
+        """Set up a small app without a display."""
+        for name in ['Canvas', 'Button', 'PhotoImage', 'filedialog', 'messagebox']:
+            patcher = patch(f'main.{name}')
+            setattr(self, f'mock_{name.lower()}', patcher.start())
+            self.addCleanup(patcher.stop)
+
+        self.size = 8
+        self.app = FractalApp(MagicMock(), 'z**2', self.size, 10,
+                              -2.0, -2.0, 2.0, 2.0, ((0, 0, 0), (255, 255, 255)))
+
+    def save_view(self, coords):
+        """Moves the app to coords, renders it and saves the frame."""
+        self.app.x_ul, self.app.y_ul, self.app.x_dr, self.app.y_dr = coords
+        self.app.update_fractal()
+        self.app.save_frame()
+
+    def test_update_fractal_shows_ppm(self):
+        """Test that the view is handed to PhotoImage as binary PPM data."""
+        self.mock_photoimage.reset_mock()
+        self.app.update_fractal()
+
+        pixels = self.app.pixels
+        self.assertEqual(pixels.shape, (self.size, self.size, 3))
+
+        kwargs = self.mock_photoimage.call_args.kwargs
+        self.assertEqual(kwargs['format'], 'PPM')
+        self.assertEqual(kwargs['data'], b'P6 8 8 255\n' + pixels.tobytes())
+        self.assertEqual(len(kwargs['data']), len(b'P6 8 8 255\n') + self.size * self.size * 3)
+
+    def test_save_frame_stores_current_pixels(self):
+        """Test that save_frame keeps an RGB image of the current view."""
+        self.app.save_frame()
+
+        self.assertEqual(len(self.app.frames), 1)
+        frame = self.app.frames[0]
+        self.assertEqual(frame.mode, 'RGB')
+        self.assertEqual(frame.tobytes(), self.app.pixels.tobytes())
+        self.assertEqual(self.app.frames_coords, [(-2.0, -2.0, 2.0, 2.0)])
+
+    def test_make_gif_frame_sequence(self):
+        """Test that make_gif puts 5 computed steps between the saved frames."""
+        self.save_view((-2.0, -2.0, 2.0, 2.0))
+        self.save_view((-1.0, -1.0, 1.0, 1.0))
+        self.save_view((-0.5, -0.5, 0.5, 0.5))
+        frames = list(self.app.frames)
+
+        steps = [Image.new('RGB', (self.size, self.size)) for _ in range(10)]
+
+        self.mock_filedialog.asksaveasfilename.return_value = 'zoom.gif'
+        with patch('main.compute_batch', return_value=steps) as mock_batch, \
+                patch.object(Image.Image, 'save', autospec=True) as mock_save:
+            self.app.make_gif()
+
+        self.mock_messagebox.showerror.assert_not_called()
+
+        # only the inner steps are computed, the ends are the saved frames
+        coords_list = mock_batch.call_args.kwargs['coords_list']
+        self.assertEqual(len(coords_list), 10)
+        self.assertEqual(coords_list[0], (-1.8333333333333333, -1.8333333333333333,
+                                          1.8333333333333333, 1.8333333333333333))
+
+        expected = ([frames[0], frames[0]] + steps[:5] + [frames[1]]
+                    + [frames[1], frames[1]] + steps[5:] + [frames[2]]
+                    + [frames[2]])
+        saved = [mock_save.call_args.args[0]] + mock_save.call_args.kwargs['append_images']
+        self.assertEqual(len(saved), len(expected))
+        for saved_frame, expected_frame in zip(saved, expected):
+            self.assertIs(saved_frame, expected_frame)
+
 if __name__ == '__main__':
     unittest.main()